@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Embedding model shared by the indexer and the searcher
+Loads all-MiniLM-L6-v2 on the fastest available backend, so chunks and
+queries are always embedded by the same model variant.
+"""
+
+import platform
+import numpy as np
+import torch
+from sentence_transformers import SentenceTransformer
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+
+# Dynamically 8-bit-quantized ONNX exports shipped with the model on the
+# Hub, each tuned for one instruction set; checked in order of preference
+ONNX_QUANTIZED_FILES = [
+    ('avx512_vnni', 'onnx/model_qint8_avx512_vnni.onnx'),
+    ('avx512f', 'onnx/model_qint8_avx512.onnx'),
+    ('avx2', 'onnx/model_quint8_avx2.onnx'),
+]
+ONNX_ARM64_FILE = 'onnx/model_qint8_arm64.onnx'
+
+# Full-precision ONNX export, for CPUs none of the quantized ones fit
+ONNX_FP32_FILE = 'onnx/model.onnx'
+
+
+def _cpu_flags():
+    """Return the x86 CPU feature flags, or an empty set if unknown"""
+    # Only Linux exposes them without extra dependencies
+    try:
+        with open('/proc/cpuinfo', 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('flags'):
+                    return set(line.split(':', 1)[1].split())
+    except OSError:
+        pass
+    return set()
+
+
+def onnx_quantized_file():
+    """Pick the quantized ONNX export built for this CPU, or None if none fits"""
+    machine = platform.machine().lower()
+    if machine in ('arm64', 'aarch64'):
+        return ONNX_ARM64_FILE
+    
+    if machine in ('x86_64', 'amd64'):
+        flags = _cpu_flags()
+        for flag, file_name in ONNX_QUANTIZED_FILES:
+            if flag in flags:
+                return file_name
+    
+    return None
+
+
+def load_model(backend="auto"):
+    """Load the embedding model, returning (model, backend actually used)"""
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    onnx_file = onnx_quantized_file()
+    if backend == "auto":
+        # Quantized ONNX only pays off with an export built for this CPU
+        backend = "onnx" if device == "cpu" and onnx_file else "torch"
+    
+    if backend == "onnx":
+        onnx_file = onnx_file or ONNX_FP32_FILE
+        try:
+            model = SentenceTransformer(
+                MODEL_NAME,
+                device="cpu",
+                backend="onnx",
+                model_kwargs={"file_name": onnx_file}
+            )
+            print(f"Model loaded successfully (onnx, {onnx_file})")
+            return model, "onnx"
+        except Exception as e:
+            print(f"ONNX backend unavailable ({e}), falling back to torch")
+    
+    model = SentenceTransformer(MODEL_NAME, device=device)
+    if device == "cuda":
+        # Half precision is plenty for normalized cosine embeddings
+        model.half()
+    print(f"Model loaded successfully (torch, {device})")
+    return model, "torch"
+
+
+def embed_texts(model, texts, batch_size=64):
+    """Encode texts into normalized float32 embeddings, in input order"""
+    # encode() already batches by length to minimize padding
+    with torch.inference_mode():
+        embeddings = model.encode(
+            texts,
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+            normalize_embeddings=True
+        )
+    
+    # FP16 models return float16 arrays; Chroma stores float32
+    return embeddings.astype(np.float32, copy=False)
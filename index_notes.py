@@ -5,18 +5,47 @@ Indexes all markdown files in the vault excluding the System directory.
 """
 
 import os
-import re
+import sys
+import json
 import hashlib
 import argparse
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-import chromadb
-from sentence_transformers import SentenceTransformer
+from vault_text import cache_body_name, chunk_content, extract_content, load_files, unchanged_result
+
+# Chunks embedded and added to ChromaDB per batch, well under its
+# 5461-record add() maximum
+ADD_BATCH_SIZE = 2048
+
+# Number of add()/delete() calls allowed to run against ChromaDB at once
+ADD_CONCURRENCY = 2
+
+# Batches in flight: one being embedded plus those being stored
+PIPELINE_DEPTH = ADD_CONCURRENCY + 1
+
+
+def _write_json(path, data):
+    """Atomically replace a JSON file"""
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
 
 
 class ObsidianVaultIndexer:
-    def __init__(self, vault_path, db_path="./chroma_db"):
+    def __init__(self, vault_path, db_path="./chroma_db", backend="auto",
+                 chunk_size=500, overlap=50):
+        # Imported here, not at module level: on spawn platforms every load
+        # worker re-imports this script, and must not pull in chromadb or torch
+        import chromadb
+        from embedding_model import load_model
+        
         self.vault_path = Path(vault_path).resolve()
         self.db_path = Path(db_path)
+        self.chunk_size = chunk_size
+        self.overlap = overlap
         
         # Validate vault path exists
         if not self.vault_path.exists():
@@ -34,75 +63,169 @@ class ObsidianVaultIndexer:
             metadata={"description": "Obsidian vault notes collection"}
         )
         
+        # Content hashes of the files currently in the collection
+        self.manifest_path = self.db_path / "manifest.json"
+        self.manifest = self.load_manifest()
+        
+        # Cleaned content of every file seen, keyed by (mtime, size) per path
+        self.cache_dir = self.db_path / "cache"
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.cache_index_path = self.cache_dir / "index.json"
+        self.content_cache = self.load_content_cache()
+        
         # Initialize embedding model
         print("Loading embedding model...")
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
-        print("Model loaded successfully")
+        self.model, self.backend = load_model(backend)
+        self.encode_lock = threading.Lock()
+        self.write_slots = threading.Semaphore(ADD_CONCURRENCY)
+    
+    def load_manifest(self):
+        """Load the relative path -> SHA-1 manifest of indexed files"""
+        # A manifest without matching documents would skip every file
+        if self.collection.count() == 0:
+            return {}
+        
+        if self.manifest_path.exists():
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable manifest {self.manifest_path}: {e}")
+        
+        return self.rebuild_manifest()
+    
+    def rebuild_manifest(self):
+        """Recover the indexed file list from a collection that has no manifest"""
+        # Hashes are unknown, so every file is re-indexed once: its old chunks
+        # are replaced and files no longer in the vault are removed
+        print("No manifest found, re-indexing every file already in the collection")
+        all_metadata = self.collection.get(include=["metadatas"])["metadatas"]
+        return {metadata["file_path"]: None for metadata in all_metadata}
+    
+    def save_manifest(self):
+        """Atomically write the manifest next to the database"""
+        _write_json(self.manifest_path, self.manifest)
+    
+    def load_content_cache(self):
+        """Load the relative path -> {mtime, size, sha1} content cache index"""
+        if not self.cache_index_path.exists():
+            return {}
+        
+        try:
+            with open(self.cache_index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable content cache {self.cache_index_path}: {e}")
+            return {}
+    
+    def save_content_cache(self):
+        """Write the content cache index and drop bodies no file refers to"""
+        _write_json(self.cache_index_path, self.content_cache)
+        
+        # Also drops bodies written by an older cleaner version
+        live_names = {cache_body_name(entry["sha1"]) for entry in self.content_cache.values()}
+        for body_path in self.cache_dir.glob('*.txt'):
+            if body_path.name not in live_names:
+                body_path.unlink(missing_ok=True)
     
     def extract_content(self, file_path):
         """Extract and clean markdown content"""
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-        except UnicodeDecodeError:
-            # Try with different encoding if UTF-8 fails
-            with open(file_path, 'r', encoding='latin-1') as f:
-                content = f.read()
-        
-        # Remove markdown syntax
-        content = re.sub(r'#{1,6}\s+', '', content)  # Headers
-        content = re.sub(r'\*\*(.*?)\*\*', r'\1', content)  # Bold
-        content = re.sub(r'\*(.*?)\*', r'\1', content)  # Italic
-        content = re.sub(r'__(.*?)__', r'\1', content)  # Underline
-        content = re.sub(r'\[(.*?)\]\(.*?\)', r'\1', content)  # Links
-        content = re.sub(r'```.*?```', '', content, flags=re.DOTALL)  # Code blocks
-        content = re.sub(r'`([^`]+)`', r'\1', content)  # Inline code
-        content = re.sub(r'^\s*[-*+]\s+', '', content, flags=re.MULTILINE)  # List items
-        content = re.sub(r'^\s*\d+\.\s+', '', content, flags=re.MULTILINE)  # Numbered lists
-        content = re.sub(r'>\s+', '', content)  # Blockquotes
-        
-        # Clean up extra whitespace
-        content = re.sub(r'\n\s*\n', '\n\n', content)
-        content = content.strip()
-        
-        return content
-    
-    def chunk_content(self, content, chunk_size=500, overlap=50):
-        """Split content into overlapping chunks"""
-        if not content.strip():
-            return []
-        
-        words = content.split()
-        if len(words) <= chunk_size:
-            return [content]
-        
-        chunks = []
-        for i in range(0, len(words), chunk_size - overlap):
-            chunk = ' '.join(words[i:i + chunk_size])
-            if chunk.strip():
-                chunks.append(chunk)
-        
-        return chunks
+        return extract_content(file_path)
+    
+    def chunk_content(self, content, chunk_size=None, overlap=None):
+        """Split content into overlapping chunks, by default as configured for this indexer"""
+        if chunk_size is None:
+            chunk_size = self.chunk_size
+        if overlap is None:
+            overlap = self.overlap
+        return chunk_content(content, chunk_size, overlap)
+    
+    def embed_chunks(self, chunks):
+        """Encode chunks into normalized embeddings, returned in input order"""
+        from embedding_model import embed_texts
+        
+        return embed_texts(self.model, chunks)
     
     def get_markdown_files(self):
-        """Get all markdown files excluding System directory"""
+        """Get all markdown file paths excluding System directory"""
         markdown_files = []
+        stack = [str(self.vault_path)]
         
-        for root, dirs, files in os.walk(self.vault_path):
-            # Skip System directory
-            if 'System' in dirs:
-                dirs.remove('System')
-            
-            # Skip hidden directories
-            dirs[:] = [d for d in dirs if not d.startswith('.')]
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = os.scandir(directory)
+            except OSError:
+                continue
             
-            for file in files:
-                if file.endswith('.md'):
-                    file_path = Path(root) / file
-                    markdown_files.append(file_path)
+            with entries:
+                for entry in entries:
+                    # DirEntry caches the file type, so no extra stat per file
+                    if entry.is_dir(follow_symlinks=False):
+                        # Skip System and hidden directories
+                        if entry.name == 'System' or entry.name.startswith('.'):
+                            continue
+                        stack.append(entry.path)
+                    elif entry.name.endswith('.md'):
+                        markdown_files.append(entry.path)
         
         return markdown_files
     
+    def prefetch_contents(self, markdown_files, group_size=32):
+        """Yield (file_path, load_file() result or exception) pairs in order"""
+        keys = [str(Path(file_path).relative_to(self.vault_path)) for file_path in markdown_files]
+        known_digests = [self.manifest.get(key) for key in keys]
+        cache_entries = [self.content_cache.get(key) for key in keys]
+        
+        # Files whose stat matches the content cache need no worker at all
+        results = [
+            unchanged_result(file_path, known_digest, cache_entry)
+            for file_path, known_digest, cache_entry
+            in zip(markdown_files, known_digests, cache_entries)
+        ]
+        to_load = [i for i, result in enumerate(results) if result is None]
+        load_args = (
+            [markdown_files[i] for i in to_load],
+            [known_digests[i] for i in to_load],
+            [cache_entries[i] for i in to_load]
+        )
+        
+        # Starting worker processes only pays off with enough files to load
+        if len(to_load) > group_size:
+            loaded = self.load_in_workers(*load_args, group_size=group_size)
+        else:
+            file_paths, digests, entries = load_args
+            loaded = iter(load_files(
+                file_paths, str(self.cache_dir), self.chunk_size, self.overlap, digests, entries
+            ))
+        
+        for file_path, result in zip(markdown_files, results):
+            yield file_path, result if result is not None else next(loaded)
+    
+    def load_in_workers(self, file_paths, known_digests, cache_entries, group_size=32):
+        """Yield load_file() results in order, computed in worker processes"""
+        # Files are handed to workers in groups to amortize pickling, with a
+        # bounded number of groups in flight to cap memory use
+        max_in_flight = 2 * (os.cpu_count() or 1)
+        pending = deque()
+        with ProcessPoolExecutor() as executor:
+            for start in range(0, len(file_paths), group_size):
+                end = start + group_size
+                pending.append(executor.submit(
+                    load_files,
+                    file_paths[start:end],
+                    str(self.cache_dir),
+                    self.chunk_size,
+                    self.overlap,
+                    known_digests[start:end],
+                    cache_entries[start:end]
+                ))
+                if len(pending) >= max_in_flight:
+                    yield from pending.popleft().result()
+            
+            while pending:
+                yield from pending.popleft().result()
+    
     def clear_collection(self):
         """Clear all documents from the collection"""
         try:
@@ -111,69 +234,198 @@ class ObsidianVaultIndexer:
             if all_docs['ids']:
                 self.collection.delete(ids=all_docs['ids'])
                 print(f"Cleared {len(all_docs['ids'])} existing documents")
+            
+            # Drop the manifest on disk too: if this run fails part way, the
+            # next one rebuilds it from what actually reached the collection
+            self.manifest = {}
+            self.manifest_path.unlink(missing_ok=True)
         except Exception as e:
             print(f"Error clearing collection: {e}")
     
-    def index_vault(self, clear_existing=True):
-        """Index all markdown files in the vault"""
+    def queue_batch(self, pipeline, pending, failed_paths, ids, documents, metadatas):
+        """Hand a batch of chunks to the pipeline to be embedded and stored"""
+        # Wait for older batches so only a bounded number are held in memory
+        while len(pending) >= PIPELINE_DEPTH:
+            self.finish_batch(pending.popleft(), failed_paths)
+        
+        stored = pipeline.submit(self.store_batch, ids, documents, metadatas)
+        pending.append((stored, metadatas))
+    
+    def finish_batch(self, batch, failed_paths):
+        """Wait for a queued batch; if it failed, record its files in failed_paths"""
+        stored, metadatas = batch
+        try:
+            stored.result()
+        except Exception as e:
+            print(f"  Error storing batch of {len(metadatas)} chunks: {e}")
+            for metadata in metadatas:
+                relative_path = metadata["file_path"]
+                failed_paths[relative_path] = failed_paths.get(relative_path, 0) + 1
+    
+    def store_batch(self, ids, documents, metadatas):
+        """Embed a batch of chunks and add it to the collection"""
+        # One batch encodes at a time while earlier batches are being stored
+        with self.encode_lock:
+            embeddings = self.embed_chunks(documents)
+        
+        with self.write_slots:
+            self.collection.add(
+                ids=ids,
+                documents=documents,
+                metadatas=metadatas,
+                # Chroma accepts a float32 ndarray; skip boxing every float
+                embeddings=embeddings
+            )
+        print(f"  Stored batch of {len(ids)} chunks")
+    
+    def record_backend(self):
+        """Store the embedding backend in the collection so searches match it"""
+        metadata = dict(self.collection.metadata or {})
+        previous = metadata.get("embedding_backend")
+        if previous == self.backend:
+            return
+        
+        if previous and self.collection.count() > 0:
+            print(f"Warning: existing chunks were embedded with the {previous} backend; "
+                  f"run with --rebuild to re-embed them with {self.backend}")
+        metadata["embedding_backend"] = self.backend
+        self.collection.modify(metadata=metadata)
+    
+    def remove_file(self, relative_path):
+        """Delete every chunk of a previously indexed file"""
+        with self.write_slots:
+            self.collection.delete(where={"file_path": relative_path})
+        self.manifest.pop(relative_path, None)
+    
+    def index_vault(self, clear_existing=False):
+        """Index new and changed markdown files in the vault"""
         if clear_existing:
             self.clear_collection()
+        self.record_backend()
         
         markdown_files = self.get_markdown_files()
         print(f"Found {len(markdown_files)} markdown files to index")
         
         total_chunks = 0
+        unchanged_files = 0
         failed_files = []
+        seen_paths = set()
         
-        for i, file_path in enumerate(markdown_files, 1):
-            try:
-                relative_path = file_path.relative_to(self.vault_path)
-                print(f"[{i}/{len(markdown_files)}] Indexing: {relative_path}")
-                
-                content = self.extract_content(file_path)
-                if not content.strip():
-                    print(f"  Skipping empty file: {relative_path}")
-                    continue
-                
-                chunks = self.chunk_content(content)
-                if not chunks:
-                    print(f"  No chunks generated for: {relative_path}")
-                    continue
-                
-                # Prepare batch data
-                documents = []
-                ids = []
-                metadatas = []
-                
-                for j, chunk in enumerate(chunks):
-                    doc_id = hashlib.md5(f"{relative_path}_{j}".encode()).hexdigest()
+        # Chunks waiting to be embedded and stored
+        batch_ids = []
+        batch_documents = []
+        batch_metadatas = []
+        pending_batches = deque()
+        # Relative path -> number of its chunks in batches that failed to store
+        failed_paths = {}
+        
+        # Files are cleaned in worker processes while this thread assembles
+        # batches and the pipeline threads embed and store earlier ones
+        with ThreadPoolExecutor(max_workers=PIPELINE_DEPTH) as pipeline:
+            prefetched = self.prefetch_contents(markdown_files)
+            for i, (file_path, loaded) in enumerate(prefetched, 1):
+                try:
+                    file_path = Path(file_path)
+                    relative_path = file_path.relative_to(self.vault_path)
+                    seen_paths.add(str(relative_path))
+                    print(f"[{i}/{len(markdown_files)}] Indexing: {relative_path}")
                     
-                    documents.append(chunk)
-                    ids.append(doc_id)
-                    metadatas.append({
-                        "file_path": str(relative_path),
-                        "chunk_index": j,
-                        "file_name": file_path.name,
-                        "directory": str(relative_path.parent),
-                        "total_chunks": len(chunks)
-                    })
-                
-                # Add to collection
-                self.collection.add(
-                    documents=documents,
-                    ids=ids,
-                    metadatas=metadatas
-                )
+                    if isinstance(loaded, Exception):
+                        raise loaded
+                    
+                    digest, chunks, cache_entry = loaded
+                    self.content_cache[str(relative_path)] = cache_entry
+                    if chunks is None:
+                        print("  Unchanged, skipping")
+                        unchanged_files += 1
+                        continue
+                    
+                    # Drop the chunks of the previous version of this file
+                    if str(relative_path) in self.manifest:
+                        self.remove_file(str(relative_path))
+                    
+                    # Empty files stay out of the manifest, which therefore
+                    # lists exactly the files that have chunks in the collection
+                    if not chunks:
+                        print(f"  Skipping empty file: {relative_path}")
+                        continue
+                    
+                    # Per-file metadata is built once and shared by every chunk,
+                    # with interned strings so each file's chunks reuse them
+                    file_metadata = {
+                        "file_path": sys.intern(str(relative_path)),
+                        "file_name": sys.intern(file_path.name),
+                        "directory": sys.intern(str(relative_path.parent))
+                    }
+                    
+                    # Hash the path once; each chunk id only adds its index
+                    id_prefix = hashlib.blake2b(str(relative_path).encode(), digest_size=16)
+                    for j, chunk in enumerate(chunks):
+                        id_hash = id_prefix.copy()
+                        id_hash.update(f"_{j}".encode())
+                        doc_id = id_hash.hexdigest()
+                        
+                        batch_documents.append(chunk)
+                        batch_ids.append(doc_id)
+                        batch_metadatas.append({**file_metadata, "chunk_index": j})
+                    
+                    self.manifest[str(relative_path)] = digest
+                    total_chunks += len(chunks)
+                    print(f"  Prepared {len(chunks)} chunks")
                 
-                total_chunks += len(chunks)
-                print(f"  Added {len(chunks)} chunks")
+                except Exception as e:
+                    print(f"  Error indexing {file_path}: {e}")
+                    failed_files.append(str(file_path))
                 
+                # Embed and store full batches as soon as they are ready
+                while len(batch_ids) >= ADD_BATCH_SIZE:
+                    self.queue_batch(
+                        pipeline, pending_batches, failed_paths,
+                        batch_ids[:ADD_BATCH_SIZE],
+                        batch_documents[:ADD_BATCH_SIZE],
+                        batch_metadatas[:ADD_BATCH_SIZE]
+                    )
+                    del batch_ids[:ADD_BATCH_SIZE]
+                    del batch_documents[:ADD_BATCH_SIZE]
+                    del batch_metadatas[:ADD_BATCH_SIZE]
+            
+            if batch_ids:
+                self.queue_batch(
+                    pipeline, pending_batches, failed_paths,
+                    batch_ids, batch_documents, batch_metadatas
+                )
+            
+            for batch in pending_batches:
+                self.finish_batch(batch, failed_paths)
+        
+        # A file whose chunks did not all reach the collection is dropped from
+        # it and from the manifest, so the next run indexes it from scratch
+        for relative_path, failed_chunks in sorted(failed_paths.items()):
+            total_chunks -= failed_chunks
+            failed_files.append(str(self.vault_path / relative_path))
+            try:
+                self.remove_file(relative_path)
             except Exception as e:
-                print(f"  Error indexing {file_path}: {e}")
-                failed_files.append(str(file_path))
+                print(f"  Error removing partial chunks of {relative_path}: {e}")
+                self.manifest[relative_path] = None
+        
+        # Drop files that were deleted from the vault since the last run
+        removed_paths = set(self.manifest) - seen_paths
+        for relative_path in sorted(removed_paths):
+            print(f"Removing deleted file: {relative_path}")
+            self.remove_file(relative_path)
+        
+        for relative_path in set(self.content_cache) - seen_paths:
+            del self.content_cache[relative_path]
+        
+        # Only record hashes once their chunks are safely stored
+        self.save_manifest()
+        self.save_content_cache()
         
         print(f"\nIndexing complete!")
         print(f"Total files processed: {len(markdown_files) - len(failed_files)}")
+        print(f"Unchanged files skipped: {unchanged_files}")
+        print(f"Removed files: {len(removed_paths)}")
         print(f"Total chunks indexed: {total_chunks}")
         
         if failed_files:
@@ -184,7 +436,7 @@ class ObsidianVaultIndexer:
         # Verify collection count
         collection_count = self.collection.count()
         print(f"Collection now contains: {collection_count} documents")
-    
+
     def get_stats(self):
         """Get collection statistics"""
         try:
@@ -208,10 +460,14 @@ def main():
                        help='Path to Obsidian vault directory')
     parser.add_argument('--db-path', default='./chroma_db', 
                        help='Path to ChromaDB database (default: ./chroma_db)')
-    parser.add_argument('--no-clear', action='store_true',
-                       help='Do not clear existing collection before indexing')
+    parser.add_argument('--rebuild', action='store_true',
+                       help='Clear the collection and re-index every file')
+    # Incremental indexing is now the default; kept so old invocations still work
+    parser.add_argument('--no-clear', action='store_true', help=argparse.SUPPRESS)
     parser.add_argument('--stats-only', action='store_true',
                        help='Only show collection statistics, do not index')
+    parser.add_argument('--backend', choices=['auto', 'onnx', 'torch'], default='auto',
+                       help='Embedding backend: quantized ONNX on CPUs with a matching export, torch for FP32/CUDA (default: auto)')
     
     args = parser.parse_args()
     
@@ -224,7 +480,8 @@ def main():
             return
     
     try:
-        indexer = ObsidianVaultIndexer(vault_path=vault_path, db_path=args.db_path)
+        indexer = ObsidianVaultIndexer(vault_path=vault_path, db_path=args.db_path,
+                                       backend=args.backend)
     except (FileNotFoundError, NotADirectoryError) as e:
         print(f"Error: {e}")
         return
@@ -232,7 +489,7 @@ def main():
     if args.stats_only:
         indexer.get_stats()
     else:
-        indexer.index_vault(clear_existing=not args.no_clear)
+        indexer.index_vault(clear_existing=args.rebuild)
         indexer.get_stats()
 
 
@@ -6,10 +6,10 @@ Search through indexed markdown files with semantic similarity.
 
 import argparse
 import json
+import re
 from pathlib import Path
 from typing import List, Dict, Any
 import chromadb
-from sentence_transformers import SentenceTransformer
 
 
 class ObsidianVaultSearcher:
@@ -31,17 +31,27 @@ class ObsidianVaultSearcher:
             print("Make sure you've run index_notes.py first to create the database.")
             exit(1)
         
-        # Initialize embedding model (same as indexer)
-        print("Loading embedding model...")
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
-        print("Model loaded successfully")
+        # Embedding model (same as indexer), loaded on the first semantic search
+        self.model = None
+    
+    def embed_query(self, query: str):
+        """Embed a query with the same model variant the indexer used"""
+        # Imported here so metadata-only commands never load torch
+        from embedding_model import embed_texts, load_model
+        
+        if self.model is None:
+            print("Loading embedding model...")
+            backend = (self.collection.metadata or {}).get("embedding_backend", "auto")
+            self.model, _ = load_model(backend)
+        
+        return embed_texts(self.model, [query])
     
     def search(self, query: str, n_results: int = 10, filter_metadata: Dict = None) -> Dict[str, Any]:
         """Search the indexed vault"""
         try:
             # Perform the search
             results = self.collection.query(
-                query_texts=[query],
+                query_embeddings=self.embed_query(query),
                 n_results=n_results,
                 where=filter_metadata
             )
@@ -104,22 +114,53 @@ class ObsidianVaultSearcher:
             
             print("-" * 40)
     
+    def match_files(self, pattern: str, match_directory: bool = False) -> List[str]:
+        """Find indexed files whose path (or directory) matches a pattern"""
+        # Matching runs over the short list of file paths instead of asking
+        # Chroma to regex-scan the metadata of every chunk
+        try:
+            regex = re.compile(pattern, re.IGNORECASE)
+        except re.error:
+            regex = re.compile(re.escape(pattern), re.IGNORECASE)
+        
+        files = self.get_indexed_files()
+        if match_directory:
+            return [f for f in files if regex.search(str(Path(f).parent))]
+        return [f for f in files if regex.search(f)]
+    
     def search_by_file_pattern(self, pattern: str, n_results: int = 20) -> Dict[str, Any]:
         """Search for files matching a pattern"""
         try:
-            results = self.collection.query(
-                query_texts=[""],  # Empty query for metadata-only search
-                n_results=n_results,
-                where={"file_path": {"$regex": f".*{pattern}.*"}}
+            matching_files = self.match_files(pattern)
+            if not matching_files:
+                return {"documents": [[]], "metadatas": [[]], "distances": [[]]}
+            
+            # Metadata-only lookup, no query embedding needed
+            results = self.collection.get(
+                where={"file_path": {"$in": matching_files}},
+                limit=n_results
             )
-            return results
+            return {
+                "documents": [results["documents"]],
+                "metadatas": [results["metadatas"]],
+                "distances": [[0.0] * len(results["documents"])]
+            }
         except Exception as e:
             print(f"Error during pattern search: {e}")
             return {"documents": [[]], "metadatas": [[]], "distances": [[]]}
     
     def search_by_directory(self, directory: str, query: str = "", n_results: int = 10) -> Dict[str, Any]:
         """Search within a specific directory"""
-        filter_dict = {"directory": {"$regex": f".*{directory}.*"}}
+        try:
+            matching_files = self.match_files(directory, match_directory=True)
+        except Exception as e:
+            print(f"Error searching directory: {e}")
+            return {"documents": [[]], "metadatas": [[]], "distances": [[]]}
+        
+        if not matching_files:
+            return {"documents": [[]], "metadatas": [[]], "distances": [[]]}
+        
+        filter_dict = {"file_path": {"$in": matching_files}}
         
         if query:
             return self.search(query, n_results, filter_dict)
@@ -160,17 +201,22 @@ class ObsidianVaultSearcher:
             print(f"Error retrieving file content: {e}")
             return []
     
+    def get_indexed_files(self) -> List[str]:
+        """Get the sorted relative paths of all indexed files"""
+        # The indexer's manifest lists every file with chunks, so reading it
+        # avoids pulling the metadata of every chunk out of the collection
+        manifest_path = self.db_path / "manifest.json"
+        if manifest_path.exists():
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                return sorted(json.load(f))
+        
+        all_metadata = self.collection.get(include=["metadatas"])["metadatas"]
+        return sorted({metadata["file_path"] for metadata in all_metadata})
+    
     def list_files(self, limit: int = 50) -> None:
         """List all indexed files"""
         try:
-            # Get unique files
-            all_metadata = self.collection.get()["metadatas"]
-            unique_files = set()
-            
-            for metadata in all_metadata:
-                unique_files.add(metadata["file_path"])
-            
-            files = sorted(list(unique_files))
+            files = self.get_indexed_files()
             
             print(f"\nIndexed files ({len(files)} total):")
             print("=" * 60)
@@ -0,0 +1,62 @@
+"""
+Regression tests for the markdown cleanup in vault_text
+"""
+
+import random
+import re
+import unittest
+
+from vault_text import clean_content
+
+
+def reference_clean_content(content):
+    """The original cleaner: ten re.sub passes applied one after another"""
+    content = re.sub(r'#{1,6}\s+', '', content)  # Headers
+    content = re.sub(r'\*\*(.*?)\*\*', r'\1', content)  # Bold
+    content = re.sub(r'\*(.*?)\*', r'\1', content)  # Italic
+    content = re.sub(r'__(.*?)__', r'\1', content)  # Underline
+    content = re.sub(r'\[(.*?)\]\(.*?\)', r'\1', content)  # Links
+    content = re.sub(r'```.*?```', '', content, flags=re.DOTALL)  # Code blocks
+    content = re.sub(r'`([^`]+)`', r'\1', content)  # Inline code
+    content = re.sub(r'^\s*[-*+]\s+', '', content, flags=re.MULTILINE)  # List items
+    content = re.sub(r'^\s*\d+\.\s+', '', content, flags=re.MULTILINE)  # Numbered lists
+    content = re.sub(r'>\s+', '', content)  # Blockquotes
+
+    # Clean up extra whitespace
+    content = re.sub(r'\n\s*\n', '\n\n', content)
+    content = content.strip()
+
+    return content
+
+
+class CleanContentTest(unittest.TestCase):
+    def test_known_cases(self):
+        cases = {
+            '***bold italic***': 'bold italic',
+            'Price is $5 * 2 = **$10**': 'Price is $5 * 2 = $10',
+            '# Title\n\n- **[link](http://x)** and `code`': 'Title\nlink and code',
+            '```\n**not bold**\n```\nafter': 'after',
+            '> quoted *text*\n1. first\n2. second': 'quoted text\nfirst\nsecond',
+            '__under__ a_b_c': 'under a_b_c',
+        }
+        for markdown, expected in cases.items():
+            with self.subTest(markdown=markdown):
+                self.assertEqual(clean_content(markdown), expected)
+                self.assertEqual(reference_clean_content(markdown), expected)
+
+    def test_matches_sequential_passes(self):
+        tokens = [
+            '*', '**', '***', '_', '__', '`', '```', '#', '## ', '> ', '>',
+            '- ', '+ ', '1. ', '[', ']', '(', ')', '](', ' ', '\n', '\n\n',
+            'word', 'x', '$5', '.', '\t',
+        ]
+        rng = random.Random(0)
+        for _ in range(20000):
+            markdown = ''.join(rng.choice(tokens) for _ in range(rng.randint(1, 25)))
+            self.assertEqual(
+                clean_content(markdown), reference_clean_content(markdown), repr(markdown)
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Markdown text processing for the Obsidian vault indexer
+Reads, hashes, cleans and chunks notes. Kept free of heavy imports so the
+indexer's worker processes start quickly.
+"""
+
+import os
+import re
+import hashlib
+import functools
+from pathlib import Path
+import numpy as np
+
+# Markdown cleanup passes, compiled once and applied in this order. Each
+# pass sees the previous one's output (e.g. bold is stripped before italic
+# so "***x***" loses all its asterisks), so the order is significant. The
+# first element is text a match cannot occur without; a pass whose trigger
+# is absent from the current text is skipped without scanning it.
+_MARKDOWN_PASSES = [
+    ('#', re.compile(r'#{1,6}\s+'), ''),  # Headers
+    ('**', re.compile(r'\*\*(.*?)\*\*'), r'\1'),  # Bold
+    ('*', re.compile(r'\*(.*?)\*'), r'\1'),  # Italic
+    ('__', re.compile(r'__(.*?)__'), r'\1'),  # Underline
+    ('](', re.compile(r'\[(.*?)\]\(.*?\)'), r'\1'),  # Links
+    ('```', re.compile(r'```.*?```', re.DOTALL), ''),  # Code blocks
+    ('`', re.compile(r'`([^`]+)`'), r'\1'),  # Inline code
+    ('', re.compile(r'^\s*[-*+]\s+', re.MULTILINE), ''),  # List items
+    ('.', re.compile(r'^\s*\d+\.\s+', re.MULTILINE), ''),  # Numbered lists
+    ('>', re.compile(r'>\s+'), ''),  # Blockquotes
+]
+_BLANK_LINES_RE = re.compile(r'\n\s*\n')
+_WORD_RE = re.compile(r'\S+')
+
+
+def decode_content(raw):
+    """Decode raw file bytes the way text-mode open() would"""
+    try:
+        content = raw.decode('utf-8')
+    except UnicodeDecodeError:
+        # Try with different encoding if UTF-8 fails
+        content = raw.decode('latin-1')
+    
+    # Universal newlines, as text-mode reads used to give us
+    return content.replace('\r\n', '\n').replace('\r', '\n')
+
+
+def clean_content(content):
+    """Strip markdown syntax and surplus blank lines from note text"""
+    # Remove markdown syntax
+    for trigger, pattern, replacement in _MARKDOWN_PASSES:
+        if trigger in content:
+            content = pattern.sub(replacement, content)
+    
+    # Clean up extra whitespace
+    content = _BLANK_LINES_RE.sub('\n\n', content)
+    content = content.strip()
+    
+    return content
+
+
+def extract_content(file_path):
+    """Extract and clean markdown content"""
+    # Read once; a non-UTF-8 file is re-decoded in memory, not re-read
+    return clean_content(decode_content(Path(file_path).read_bytes()))
+
+
+@functools.lru_cache(maxsize=None)
+def make_chunker(chunk_size=500, overlap=50):
+    """Build a chunking function specialized for one chunk size and overlap"""
+    stride = chunk_size - overlap
+    find_words = _WORD_RE.finditer
+    array, arange, minimum = np.array, np.arange, np.minimum
+    
+    def chunk(content):
+        """Split content into overlapping chunks"""
+        if not content.strip():
+            return []
+        
+        # Slice chunks straight out of content using word offsets
+        spans = [match.span() for match in find_words(content)]
+        if len(spans) <= chunk_size:
+            return [content]
+        
+        # Character bounds of every chunk, computed in one vectorized step
+        spans = array(spans)
+        first_words = arange(0, len(spans), stride)
+        last_words = minimum(first_words + chunk_size, len(spans)) - 1
+        starts = spans[first_words, 0].tolist()
+        ends = spans[last_words, 1].tolist()
+        
+        return [content[start:end] for start, end in zip(starts, ends)]
+    
+    return chunk
+
+
+def chunk_content(content, chunk_size=500, overlap=50):
+    """Split content into overlapping chunks"""
+    return make_chunker(chunk_size, overlap)(content)
+
+
+# Version of clean_content()'s output, part of every cached body's name so
+# bodies written by an older cleaner are regenerated rather than reused.
+# Bump it whenever a change to the cleanup alters what it produces.
+CLEANER_VERSION = 2
+
+
+def cache_body_name(digest):
+    """File name of the cached cleaned body for a content hash"""
+    return f"{digest}.v{CLEANER_VERSION}.txt"
+
+
+def unchanged_result(file_path, known_digest, cache_entry):
+    """Return load_file()'s result if a stat alone shows the file is unchanged"""
+    if known_digest is None or not cache_entry or cache_entry["sha1"] != known_digest:
+        return None
+    
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        # Let load_file() report the error
+        return None
+    
+    if cache_entry["mtime"] == stat.st_mtime_ns and cache_entry["size"] == stat.st_size:
+        return known_digest, None, cache_entry
+    return None
+
+
+def load_file(file_path, cache_dir, chunker=chunk_content, known_digest=None, cache_entry=None):
+    """Return (sha1, chunks, cache_entry) for a file; chunks is None if sha1 == known_digest"""
+    raw = None
+    stat = os.stat(file_path)
+    if (cache_entry and cache_entry["mtime"] == stat.st_mtime_ns
+            and cache_entry["size"] == stat.st_size):
+        # Not modified since it was last seen, so its hash is still valid
+        digest = cache_entry["sha1"]
+    else:
+        raw = Path(file_path).read_bytes()
+        digest = hashlib.sha1(raw).hexdigest()
+        cache_entry = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "sha1": digest}
+    
+    if digest == known_digest:
+        return digest, None, cache_entry
+    
+    # Cleaned bodies are keyed by content hash and cleaner version; a missing,
+    # unreadable or corrupt body is simply regenerated
+    body_path = os.path.join(cache_dir, cache_body_name(digest))
+    try:
+        with open(body_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+    except (OSError, ValueError):
+        if raw is None:
+            raw = Path(file_path).read_bytes()
+        content = clean_content(decode_content(raw))
+        tmp_path = f"{body_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, body_path)
+    
+    return digest, chunker(content), cache_entry
+
+
+def load_files(file_paths, cache_dir, chunk_size, overlap, known_digests, cache_entries):
+    """Worker task: load_file() over a group of files, capturing errors per file"""
+    # Cached per process, so each worker specializes the chunker only once
+    chunker = make_chunker(chunk_size, overlap)
+    results = []
+    for file_path, known_digest, cache_entry in zip(file_paths, known_digests, cache_entries):
+        try:
+            results.append(load_file(file_path, cache_dir, chunker, known_digest, cache_entry))
+        except Exception as e:
+            results.append(e)
+    return results